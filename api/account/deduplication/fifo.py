@@ -16,9 +16,13 @@ def fifo(community: Community, fifo_passport: dict, address: str) -> Tuple[dict,
         for stamp in fifo_passport["stamps"]:
             stamp_hash = stamp["credential"]["credentialSubject"]["hash"]
 
-            existing_stamps = Stamp.objects.filter(
-                hash=stamp_hash, passport__community=community
-            ).exclude(passport__address=address)
+            existing_stamps = (
+                Stamp.objects.filter(hash=stamp_hash, passport__community=community)
+                .exclude(passport__address=address)
+                .select_related("passport")
+                # The stamp credentials are not needed, only what is required to delete the stamp and rescore the passport
+                .only("pk", "passport", "passport__address")
+            )
 
             for existing_stamp in existing_stamps.iterator():
                 existing_stamp_passport = existing_stamp.passport
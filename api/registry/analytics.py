@@ -0,0 +1,95 @@
+import atexit
+import os
+import queue
+import threading
+import time
+
+import api_logging as logging
+from account.models import AccountAPIKeyAnalytics
+from django.db import close_old_connections
+
+log = logging.getLogger(__name__)
+
+# Interval in seconds in which the queued api key analytics are saved to the DB
+API_KEY_ANALYTICS_FLUSH_INTERVAL = 0.2
+# Maximum number of queued entries. Entries are dropped when the queue is full, for example
+# if saving to the DB keeps failing, so that the memory of the process does not grow without limit
+API_KEY_ANALYTICS_QUEUE_SIZE = 10000
+
+_analytics_queue: queue.Queue = queue.Queue(maxsize=API_KEY_ANALYTICS_QUEUE_SIZE)
+_analytics_thread: threading.Thread | None = None
+_analytics_thread_lock = threading.Lock()
+
+
+def queue_api_key_analytics(api_key_id, path):
+    """
+    Queue the analytics entry for the api key. The entries are saved in batches by a background thread,
+    so that the request does not need to wait for the insert.
+    """
+    _start_analytics_thread()
+    try:
+        _analytics_queue.put_nowait((api_key_id, path))
+    except queue.Full:
+        log.warning(
+            "Api key analytics queue is full, dropping entry for api_key_id=%s, path='%s'",
+            api_key_id,
+            path,
+        )
+
+
+def flush_api_key_analytics() -> int:
+    """
+    Save all queued api key analytics entries to the DB and return the number of saved entries
+    """
+    batch = []
+    while True:
+        try:
+            api_key_id, path = _analytics_queue.get_nowait()
+        except queue.Empty:
+            break
+        batch.append(AccountAPIKeyAnalytics(api_key_id=api_key_id, path=path))
+
+    if batch:
+        AccountAPIKeyAnalytics.objects.bulk_create(batch, batch_size=500)
+    return len(batch)
+
+
+def _flush_api_key_analytics_periodically():
+    while True:
+        time.sleep(API_KEY_ANALYTICS_FLUSH_INTERVAL)
+        try:
+            flush_api_key_analytics()
+        except Exception:
+            log.error("Error when saving api key analytics", exc_info=True)
+        finally:
+            close_old_connections()
+
+
+def _start_analytics_thread():
+    global _analytics_thread
+    if _analytics_thread and _analytics_thread.is_alive():
+        return
+
+    with _analytics_thread_lock:
+        # (Re)start the thread if it was never started or if it is not running anymore
+        if not _analytics_thread or not _analytics_thread.is_alive():
+            if not _analytics_thread:
+                # Do not lose the entries still queued when the process exits
+                atexit.register(flush_api_key_analytics)
+            _analytics_thread = threading.Thread(
+                target=_flush_api_key_analytics_periodically,
+                name="api-key-analytics",
+                daemon=True,
+            )
+            _analytics_thread.start()
+
+
+def _reset_after_fork():
+    # The thread is not running in the forked child, and the entries queued before the fork
+    # will be saved by the parent process
+    global _analytics_queue, _analytics_thread_lock
+    _analytics_queue = queue.Queue(maxsize=API_KEY_ANALYTICS_QUEUE_SIZE)
+    _analytics_thread_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
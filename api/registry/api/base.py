@@ -8,7 +8,7 @@ from django_ratelimit.core import is_ratelimited
 from django_ratelimit.decorators import ALL
 from django_ratelimit.exceptions import Ratelimited
 from ninja.security import APIKeyHeader
-from registry.tasks import asave_api_key_analytics, save_api_key_analytics
+from registry.analytics import queue_api_key_analytics
 
 from ..exceptions import InvalidScorerIdException, Unauthorized
 from .schema import SubmitPassportPayload
@@ -43,7 +43,7 @@ class ApiKey(APIKeyHeader):
             user_account = api_key.account
 
             if settings.FF_API_ANALYTICS == "on":
-                save_api_key_analytics(api_key.id, request.path)
+                queue_api_key_analytics(api_key.id, request.path)
 
             if user_account:
                 request.user = user_account.user
@@ -74,7 +74,7 @@ async def aapi_key(request):
         raise AccountAPIKey.DoesNotExist("Key is not valid.")
 
     if settings.FF_API_ANALYTICS == "on":
-        asave_api_key_analytics(api_key.id, request.path)
+        queue_api_key_analytics(api_key.id, request.path)
 
     user_account = await Account.objects.aget(pk=api_key.account_id)
     if user_account:
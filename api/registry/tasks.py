@@ -1,3 +1,4 @@
+import asyncio
 from datetime import datetime, timezone
 
 import api_logging as logging
@@ -7,50 +8,56 @@ from account.deduplication.lifo import lifo
 from account.models import AccountAPIKey, AccountAPIKeyAnalytics, Community
 from asgiref.sync import async_to_sync
 from celery import shared_task
+from celery.signals import worker_process_init
+from django.db import transaction
+from django.db.models import Q
 from ninja_extra.exceptions import APIException
 from reader.passport_reader import get_did, get_passport
 from registry.exceptions import NoPassportException
 from registry.models import Passport, Score, Stamp
 from registry.utils import validate_credential, verify_issuer
+from scorer_weighted.models import Scorer
 
 log = logging.getLogger(__name__)
 
+# Event loop of the worker process, used to run the async validations of the scoring tasks
+_worker_event_loop = None
+
 
 def get_utc_time():
     return datetime.now(timezone.utc)
 
 
-@shared_task
-def save_api_key_analytics(api_key_id, path):
-    try:
-        AccountAPIKeyAnalytics.objects.create(
-            api_key_id=api_key_id,
-            path=path,
-        )
-    except Exception as e:
-        pass
+@worker_process_init.connect
+def init_worker_event_loop(**kwargs):
+    """
+    Create one event loop per (prefork) worker process, instead of setting up the event loop in
+    async_to_sync for each call. This signal is not sent for the gevent, threads and solo pools,
+    which keep using async_to_sync.
+    """
+    global _worker_event_loop
+    _worker_event_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_worker_event_loop)
 
 
-def asave_api_key_analytics(api_key_id, path):
-    try:
-        AccountAPIKeyAnalytics.objects.acreate(
-            api_key_id=api_key_id,
-            path=path,
-        )
-    except Exception as e:
-        pass
+def run_async(async_function, *args):
+    if _worker_event_loop:
+        return _worker_event_loop.run_until_complete(async_function(*args))
+    return async_to_sync(async_function)(*args)
 
 
+# Kept for the tasks that are still queued from previous deployments, use registry.analytics.queue_api_key_analytics instead
 @shared_task
-def score_passport_passport(community_id: int, address: str):
-    score_passport(community_id, address)
+def save_api_key_analytics(api_key_id, path):
+    AccountAPIKeyAnalytics.objects.create(
+        api_key_id=api_key_id,
+        path=path,
+    )
 
 
+# With the prefork pool, the worker processes running the scoring tasks are recycled according to
+# CELERY_WORKER_MAX_TASKS_PER_CHILD and CELERY_WORKER_MAX_MEMORY_PER_CHILD, see scorer/settings/celery.py
 @shared_task
-def score_registry_passport(community_id: int, address: str):
-    score_passport(community_id, address)
-
-
 def score_passport(community_id: int, address: str):
     log.info(
         "score_passport request for community_id=%s, address='%s'",
@@ -68,10 +75,18 @@ def score_passport(community_id: int, address: str):
                 community_id,
             )
             return
-        remove_existing_stamps_from_db(passport)
+        # The community is loaded only once (together with the passport) and shared by deduplication and scoring
+        community = passport.community
         passport_data = load_passport_data(address)
-        validate_and_save_stamps(passport, passport_data)
-        calculate_score(passport, community_id)
+        scorer = community.get_scorer()
+        # The credentials are verified before the transaction is opened, so that no row locks
+        # are held while waiting for the network
+        passport_data = validate_stamps(passport, passport_data)
+        # All writes of the scoring are committed at once. If anything fails the transaction
+        # is rolled back and the error score is saved by the exception handlers below
+        with transaction.atomic():
+            deduplicate_and_save_stamps(passport, passport_data, community, scorer)
+            calculate_score(passport, community, scorer)
 
     except APIException as e:
         log.error(
@@ -81,17 +96,7 @@ def score_passport(community_id: int, address: str):
             exc_info=True,
         )
         if passport:
-            # Create a score with error status
-            Score.objects.update_or_create(
-                passport_id=passport.pk,
-                defaults=dict(
-                    score=None,
-                    status=Score.Status.ERROR,
-                    last_score_timestamp=None,
-                    evidence=None,
-                    error=e.detail,
-                ),
-            )
+            _mark_score_error(passport.pk, e.detail)
     except Exception as e:
         log.error(
             "Error when handling passport submission. community_id=%s, address='%s'",
@@ -100,17 +105,38 @@ def score_passport(community_id: int, address: str):
             exc_info=True,
         )
         if passport:
-            # Create a score with error status
-            Score.objects.update_or_create(
-                passport_id=passport.pk,
-                defaults=dict(
-                    score=None,
-                    status=Score.Status.ERROR,
-                    last_score_timestamp=None,
-                    evidence=None,
-                    error=str(e),
-                ),
-            )
+            _mark_score_error(passport.pk, str(e))
+
+
+def _save_score(passport_id: int, **score_fields):
+    # The score typically exists already (created when the passport was submitted), so we only
+    # create it if there was nothing to update. Unlike update_or_create this does not SELECT the row first
+    if not Score.objects.filter(passport_id=passport_id).update(**score_fields):
+        Score.objects.create(passport_id=passport_id, **score_fields)
+
+
+def _mark_score_error(passport_id: int, error: str):
+    _save_score(
+        passport_id,
+        score=None,
+        status=Score.Status.ERROR,
+        last_score_timestamp=None,
+        evidence=None,
+        error=error,
+    )
+
+
+# The API keeps enqueueing the tasks below for one release, because the workers are deployed separately
+# and the ones still running the previous version only know these names. They are routed to their own
+# queues in scorer/celery.py. In the next release the API will enqueue score_passport and these will be removed
+@shared_task(name="registry.tasks.score_passport_passport")
+def score_passport_passport(community_id: int, address: str):
+    score_passport(community_id, address)
+
+
+@shared_task(name="registry.tasks.score_registry_passport")
+def score_registry_passport(community_id: int, address: str):
+    score_passport(community_id, address)
 
 
 def load_passport_data(address: str):
@@ -124,46 +150,49 @@ def load_passport_data(address: str):
 
 def load_passport_record(community_id: int, address: str) -> Passport | None:
     # A Passport instance should exist, and have the requires_calculation flag set to True if it requires calculation.
-    # We check for this by running an update and checking for the number of updated rows
-    # This update should also avoid race conditions as stated in the documentation: https://docs.djangoproject.com/en/4.2/ref/models/querysets/#update
     # We query for all passports that have requires_calculation not set to False
     # because we want to calculate the score for any passport that has requires_calculation set to True or None
-    num_passports_updated = (
-        Passport.objects.filter(address=address.lower(), community_id=community_id)
-        .exclude(requires_calculation=False)
-        .update(requires_calculation=False)
-    )
-
-    # If the num_passports_updated == 1, this means we are in the lucky task that has managed to pick this passport up for processing
-    # Other tasks which are potentially racing for the same calculation should get num_passports_updated == 0
-    if num_passports_updated == 1:
-        db_passport = Passport.objects.get(
-            address=address.lower(),
-            community_id=community_id,
+    # The row is locked while we reset the flag, and rows locked by other tasks are skipped,
+    # which avoids race conditions: https://docs.djangoproject.com/en/4.2/ref/models/querysets/#select-for-update
+    with transaction.atomic():
+        db_passport = (
+            Passport.objects.select_for_update(skip_locked=True, of=("self",))
+            .select_related("community")
+            .filter(address=address.lower(), community_id=community_id)
+            .exclude(requires_calculation=False)
+            .first()
         )
-        return db_passport
-    else:
-        # Just in case the Passport does not exist, we create it
-        if not Passport.objects.filter(
-            address=address.lower(), community_id=community_id
-        ).exists():
-            db_passport, _ = Passport.objects.update_or_create(
-                address=address.lower(), community_id=community_id
+
+        # If we found the passport, this means we are in the lucky task that has managed to pick this passport up for processing
+        # Other tasks which are potentially racing for the same calculation will skip the locked row or see requires_calculation=False
+        if db_passport:
+            Passport.objects.filter(pk=db_passport.pk).update(
+                requires_calculation=False
             )
+            db_passport.requires_calculation = False
             return db_passport
-    return None
 
+    # Just in case the Passport does not exist, we create it
+    db_passport, created = Passport.objects.get_or_create(
+        address=address.lower(), community_id=community_id
+    )
+    return db_passport if created else None
 
-def process_deduplication(passport, passport_data):
+
+def process_deduplication(
+    passport, passport_data, community: Community, scorer: Scorer | None = None
+):
     """
     Process deduplication based on the community rule
+    The `scorer` of the community is used to rescore the affected passports, it is loaded if not provided
+    The dedup methods return the affected passports as a list (None for LIFO), only their `pk` is used for rescoring
     """
     rule_map = {
         Rules.LIFO.value: lifo,
         Rules.FIFO.value: fifo,
     }
 
-    method = rule_map.get(passport.community.rule)
+    method = rule_map.get(community.rule)
 
     log.debug(
         "Processing deduplication for address='%s' and method='%s'",
@@ -175,7 +204,7 @@ def process_deduplication(passport, passport_data):
         raise Exception("Invalid rule")
 
     deduplicated_passport, affected_passports = method(
-        passport.community, passport_data, passport.address
+        community, passport_data, passport.address
     )
 
     log.debug(
@@ -185,63 +214,94 @@ def process_deduplication(passport, passport_data):
     )
 
     # If the rule is FIFO, we need to re-score all affected passports
-    if passport.community.rule == Rules.FIFO.value:
-        for passport in affected_passports:
-            log.debug(
-                "FIFO scoring selected, rescoring passport='%s'",
-                passport,
-            )
+    if community.rule == Rules.FIFO.value and affected_passports:
+        # The same passport is listed once for each of its removed stamps
+        passport_ids = list(dict.fromkeys(p.pk for p in affected_passports))
+        log.debug(
+            "FIFO scoring selected, rescoring passports='%s'",
+            passport_ids,
+        )
 
-            Score.objects.update_or_create(
-                passport=passport,
-                defaults=dict(score=None, status=Score.Status.PROCESSING),
-            )
-            calculate_score(passport, passport.community_id)
+        scorer = scorer or community.get_scorer()
+        scores = scorer.compute_score(passport_ids)
+
+        last_score_timestamp = get_utc_time()
+        Score.objects.bulk_create(
+            [
+                Score(
+                    passport_id=passport_id,
+                    score=scoreData.score,
+                    status=Score.Status.DONE,
+                    last_score_timestamp=last_score_timestamp,
+                    evidence=get_score_evidence(scoreData),
+                    error=None,
+                )
+                for passport_id, scoreData in zip(passport_ids, scores)
+            ],
+            update_conflicts=True,
+            unique_fields=["passport"],
+            update_fields=[
+                "score",
+                "status",
+                "last_score_timestamp",
+                "evidence",
+                "error",
+            ],
+        )
 
     return deduplicated_passport
 
 
-def validate_and_save_stamps(passport: Passport, passport_data):
-    log.debug("getting stamp data ")
+async def validate_credentials(did, stamps):
+    # Validate all credentials concurrently, the results are in the same order as the stamps
+    tasks = [
+        asyncio.ensure_future(validate_credential(did, stamp["credential"]))
+        for stamp in stamps
+    ]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        # Do not leave the other validations pending on the (persistent) worker event loop,
+        # where they would run during the next task
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
 
-    log.debug("processing deduplication")
 
-    deduped_passport_data = process_deduplication(passport, passport_data)
+def validate_stamps(passport: Passport, passport_data) -> dict:
+    """
+    Return a copy of `passport_data` that only contains the valid stamps. This verifies the credentials
+    (which requires network access), so it shall not run inside a DB transaction
+    """
+    passport_stamps = passport_data.get("stamps") or []
+    if not passport_stamps:
+        return {**passport_data, "stamps": []}
 
     log.debug("validating stamps")
     did = get_did(passport.address)
 
-    for stamp in deduped_passport_data["stamps"]:
-        stamp_return_errors = async_to_sync(validate_credential)(
-            did, stamp["credential"]
+    errors_per_stamp = run_async(validate_credentials, did, passport_stamps)
+
+    now = datetime.now(timezone.utc)
+    valid_stamps = []
+    for stamp, stamp_return_errors in zip(passport_stamps, errors_per_stamp):
+        stamp_expiration_date = datetime.fromisoformat(
+            stamp["credential"]["expirationDate"]
         )
-        try:
-            # TODO: use some library or https://docs.python.org/3/library/datetime.html#datetime.datetime.fromisoformat to
-            # parse iso timestamps
-            stamp_expiration_date = datetime.strptime(
-                stamp["credential"]["expirationDate"], "%Y-%m-%dT%H:%M:%S.%fZ"
-            )
-        except ValueError:
-            stamp_expiration_date = datetime.strptime(
-                stamp["credential"]["expirationDate"], "%Y-%m-%dT%H:%M:%SZ"
-            )
+        if stamp_expiration_date.tzinfo is None:
+            # Dates without an offset are in UTC
+            stamp_expiration_date = stamp_expiration_date.replace(tzinfo=timezone.utc)
 
         is_issuer_verified = verify_issuer(stamp)
         # check that expiration date is not in the past
-        stamp_is_expired = stamp_expiration_date < datetime.now()
+        stamp_is_expired = stamp_expiration_date < now
         if (
             len(stamp_return_errors) == 0
             and not stamp_is_expired
             and is_issuer_verified
         ):
-            Stamp.objects.update_or_create(
-                hash=stamp["credential"]["credentialSubject"]["hash"],
-                passport=passport,
-                defaults={
-                    "provider": stamp["provider"],
-                    "credential": stamp["credential"],
-                },
-            )
+            valid_stamps.append(stamp)
         else:
             log.info(
                 "Stamp not created. Stamp=%s\nReason: errors=%s stamp_is_expired=%s is_issuer_verified=%s",
@@ -251,28 +311,82 @@ def validate_and_save_stamps(passport: Passport, passport_data):
                 is_issuer_verified,
             )
 
+    return {**passport_data, "stamps": valid_stamps}
 
-def remove_existing_stamps_from_db(passport: Passport):
-    Stamp.objects.filter(passport=passport).delete()
 
+def lock_stamps_to_replace(passport: Passport, passport_data, community: Community):
+    """
+    Lock the stamps that are deleted when saving the stamps of `passport`: its own stamps and, for FIFO,
+    the duplicates in other passports. All rows are locked in one statement ordered by pk, so that two
+    tasks deleting each other's duplicates wait for each other instead of deadlocking
+    """
+    stamps_to_lock = Q(passport=passport)
+    if community.rule == Rules.FIFO.value:
+        hashes = [
+            stamp["credential"]["credentialSubject"]["hash"]
+            for stamp in passport_data.get("stamps") or []
+        ]
+        if hashes:
+            stamps_to_lock |= Q(hash__in=hashes, passport__community=community)
+
+    list(
+        Stamp.objects.select_for_update(of=("self",))
+        .filter(stamps_to_lock)
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
 
-def calculate_score(passport: Passport, community_id: int):
-    log.debug("Scoring")
-    user_community = Community.objects.get(pk=community_id)
 
-    scorer = user_community.get_scorer()
+def deduplicate_and_save_stamps(
+    passport: Passport,
+    passport_data,
+    community: Community,
+    scorer: Scorer | None = None,
+):
+    # score_passport already runs this in its transaction, savepoint=False avoids the extra
+    # SAVEPOINT / RELEASE round-trips and only opens a transaction when called on its own
+    with transaction.atomic(savepoint=False):
+        lock_stamps_to_replace(passport, passport_data, community)
+
+        log.debug("processing deduplication")
+
+        deduped_passport_data = process_deduplication(
+            passport, passport_data, community, scorer
+        )
+
+        stamps = [
+            Stamp(
+                hash=stamp["credential"]["credentialSubject"]["hash"],
+                passport=passport,
+                provider=stamp["provider"],
+                credential=stamp["credential"],
+            )
+            for stamp in deduped_passport_data.get("stamps") or []
+        ]
+
+        Stamp.objects.filter(passport=passport).delete()
+        Stamp.objects.bulk_create(stamps, batch_size=500, ignore_conflicts=True)
+
+
+def calculate_score(
+    passport: Passport, community: Community, scorer: Scorer | None = None
+):
+    log.debug("Scoring")
+    scorer = scorer or community.get_scorer()
     scores = scorer.compute_score([passport.pk])
 
     log.info("Scores for address '%s': %s", passport.address, scores)
     scoreData = scores[0]
 
-    Score.objects.update_or_create(
-        passport_id=passport.pk,
-        defaults=dict(
-            score=scoreData.score,
-            status=Score.Status.DONE,
-            last_score_timestamp=get_utc_time(),
-            evidence=scoreData.evidence[0].as_dict() if scoreData.evidence else None,
-            error=None,
-        ),
+    _save_score(
+        passport.pk,
+        score=scoreData.score,
+        status=Score.Status.DONE,
+        last_score_timestamp=get_utc_time(),
+        evidence=get_score_evidence(scoreData),
+        error=None,
     )
+
+
+def get_score_evidence(scoreData) -> dict | None:
+    return scoreData.evidence[0].as_dict() if scoreData.evidence else None
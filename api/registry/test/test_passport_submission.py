@@ -2,6 +2,7 @@ import binascii
 import copy
 import json
 from datetime import datetime, timedelta, timezone
+from decimal import Decimal
 from unittest.mock import patch
 
 from account.deduplication import Rules
@@ -12,9 +13,10 @@ from django.contrib.auth.models import User
 from django.test import Client, TransactionTestCase
 from eth_account.messages import encode_defunct
 from registry import permissions
-from registry.models import Passport, Stamp
+from registry.models import Passport, Score, Stamp
 from registry.tasks import score_passport
 from registry.utils import get_signer, get_signing_message, verify_issuer
+from scorer_weighted.models import WeightedScorer
 from web3 import Web3
 
 web3 = Web3()
@@ -784,6 +786,60 @@ class ValidatePassportTestCase(TransactionTestCase):
             stamp_google.hash, google_credential["credentialSubject"]["hash"]
         )
 
+    def _score_stamps_expiring_at(self, expiration_dates):
+        """
+        Score a passport having one Google stamp for each of the `expiration_dates`
+        and return the expiration dates of the stamps that were saved
+        """
+        stamps = []
+        for index, expiration_date in enumerate(expiration_dates):
+            credential = copy.deepcopy(google_credential)
+            credential["expirationDate"] = expiration_date
+            credential["credentialSubject"]["hash"] = f"v0.0.0:expiration-{index}"
+            stamps.append({"provider": "Google", "credential": credential})
+
+        Passport.objects.create(
+            address=self.account.address.lower(),
+            community=self.community,
+            requires_calculation=True,
+        )
+
+        with patch("registry.tasks.get_passport", return_value={"stamps": stamps}):
+            with patch(
+                "registry.tasks.validate_credential",
+                side_effect=[[] for _ in stamps],
+            ):
+                score_passport(self.community.id, self.account.address)
+
+        return {stamp.credential["expirationDate"] for stamp in Stamp.objects.all()}
+
+    def test_submit_passport_with_expiration_dates_with_offset(self):
+        """
+        Verify that the offset of the expiration date is taken into account
+        """
+        now = datetime.now(timezone.utc)
+        offset_east = timezone(timedelta(hours=5))
+        offset_west = timezone(timedelta(hours=-5))
+        # The local time in these dates is after, respectively before the current UTC time
+        expired = (now - timedelta(hours=1)).astimezone(offset_east).isoformat()
+        not_expired = (now + timedelta(hours=1)).astimezone(offset_west).isoformat()
+
+        saved_expiration_dates = self._score_stamps_expiring_at([expired, not_expired])
+
+        self.assertEqual(saved_expiration_dates, {not_expired})
+
+    def test_submit_passport_with_expiration_dates_without_offset(self):
+        """
+        Verify that expiration dates without an offset are treated as UTC
+        """
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        expired = (now - timedelta(hours=1)).isoformat()
+        not_expired = (now + timedelta(hours=1)).isoformat()
+
+        saved_expiration_dates = self._score_stamps_expiring_at([expired, not_expired])
+
+        self.assertEqual(saved_expiration_dates, {not_expired})
+
     @patch("registry.tasks.validate_credential", side_effect=[[], [], []])
     @patch(
         "registry.tasks.get_passport",
@@ -980,6 +1036,166 @@ class ValidatePassportTestCase(TransactionTestCase):
         self.assertEqual(submitted_passport.stamps.count(), 1)
         self.assertEqual(submitted_passport.stamps.all()[0].provider, "Google")
 
+    @patch("registry.tasks.validate_credential", side_effect=[[], []])
+    @patch(
+        "registry.tasks.get_passport",
+        return_value=mock_passport_2,
+    )
+    def test_fifo_deduplication_rescores_affected_passports(
+        self, get_passport, validate_credential
+    ):
+        """
+        Test that the passports that lost stamps in FIFO deduplication are rescored, each of them only once
+        """
+        address_1 = self.account.address.lower()
+        address_2 = self.mock_account.address.lower()
+
+        with patch(
+            "scorer_weighted.models.settings.GITCOIN_PASSPORT_WEIGHTS",
+            {"Google": 1, "Ens": 1, "Facebook": 3},
+        ):
+            fifo_community = Community.objects.create(
+                name="My FIFO Community",
+                description="My FIFO Community description",
+                account=self.user_account,
+                rule=Rules.FIFO.value,
+            )
+
+        first_passport = Passport.objects.create(
+            address=address_1, community=fifo_community
+        )
+        Stamp.objects.create(
+            passport=first_passport,
+            hash="v0.0.0:facebook",
+            provider="Facebook",
+            credential={},
+        )
+        # Both stamps are duplicates of the submitted ones, so the first passport is affected twice
+        Stamp.objects.create(
+            passport=first_passport,
+            hash=ens_credential["credentialSubject"]["hash"],
+            provider="Ens",
+            credential=ens_credential,
+        )
+        Stamp.objects.create(
+            passport=first_passport,
+            hash=google_credential_2["credentialSubject"]["hash"],
+            provider="Google",
+            credential=google_credential_2,
+        )
+        Score.objects.create(
+            passport=first_passport,
+            score=Decimal(5),
+            status=Score.Status.DONE,
+        )
+
+        submitted_passport = Passport.objects.create(
+            address=address_2, community=fifo_community, requires_calculation=True
+        )
+
+        with patch.object(
+            WeightedScorer,
+            "compute_score",
+            autospec=True,
+            side_effect=WeightedScorer.compute_score,
+        ) as compute_score:
+            score_passport(fifo_community.pk, address_2)
+
+        # The affected passport is rescored with a single scorer call, then the submitted one is scored
+        self.assertEqual(
+            [c.args[1] for c in compute_score.call_args_list],
+            [[first_passport.pk], [submitted_passport.pk]],
+        )
+
+        self.assertEqual(first_passport.stamps.count(), 1)
+        first_score = Score.objects.get(passport=first_passport)
+        self.assertEqual(first_score.score, Decimal(3))
+        self.assertEqual(first_score.status, Score.Status.DONE)
+        self.assertIsNone(first_score.evidence)
+        self.assertIsNone(first_score.error)
+        self.assertIsNotNone(first_score.last_score_timestamp)
+
+        submitted_score = Score.objects.get(passport=submitted_passport)
+        self.assertEqual(submitted_score.score, Decimal(2))
+        self.assertEqual(submitted_score.status, Score.Status.DONE)
+
+    @patch(
+        "registry.tasks.validate_credential",
+        side_effect=[["Invalid credential"], ["Invalid credential"]],
+    )
+    @patch(
+        "registry.tasks.get_passport",
+        return_value=mock_passport_2,
+    )
+    def test_fifo_deduplication_ignores_invalid_stamps(
+        self, get_passport, validate_credential
+    ):
+        """
+        Test that invalid submitted stamps do not remove their duplicates from other passports in FIFO deduplication
+        """
+        address_1 = self.account.address.lower()
+        address_2 = self.mock_account.address.lower()
+
+        fifo_community = Community.objects.create(
+            name="My FIFO Community",
+            description="My FIFO Community description",
+            account=self.user_account,
+            rule=Rules.FIFO.value,
+        )
+
+        first_passport = Passport.objects.create(
+            address=address_1, community=fifo_community
+        )
+        Stamp.objects.create(
+            passport=first_passport,
+            hash=ens_credential["credentialSubject"]["hash"],
+            provider="Ens",
+            credential=ens_credential,
+        )
+        Stamp.objects.create(
+            passport=first_passport,
+            hash=google_credential_2["credentialSubject"]["hash"],
+            provider="Google",
+            credential=google_credential_2,
+        )
+        Score.objects.create(
+            passport=first_passport,
+            score=Decimal(2),
+            status=Score.Status.DONE,
+        )
+
+        submitted_passport = Passport.objects.create(
+            address=address_2, community=fifo_community, requires_calculation=True
+        )
+
+        with patch.object(
+            WeightedScorer,
+            "compute_score",
+            autospec=True,
+            side_effect=WeightedScorer.compute_score,
+        ) as compute_score:
+            score_passport(fifo_community.pk, address_2)
+
+        # Only the submitted passport is scored
+        self.assertEqual(
+            [c.args[1] for c in compute_score.call_args_list],
+            [[submitted_passport.pk]],
+        )
+
+        self.assertEqual(
+            set(first_passport.stamps.values_list("provider", flat=True)),
+            {"Ens", "Google"},
+        )
+        first_score = Score.objects.get(passport=first_passport)
+        self.assertEqual(first_score.score, Decimal(2))
+        self.assertEqual(first_score.status, Score.Status.DONE)
+        self.assertIsNone(first_score.last_score_timestamp)
+
+        self.assertEqual(submitted_passport.stamps.count(), 0)
+        submitted_score = Score.objects.get(passport=submitted_passport)
+        self.assertEqual(submitted_score.score, Decimal(0))
+        self.assertEqual(submitted_score.status, Score.Status.DONE)
+
     @patch("registry.tasks.validate_credential", side_effect=[[], []])
     @patch(
         "registry.tasks.get_passport",
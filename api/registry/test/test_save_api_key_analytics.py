@@ -1,7 +1,11 @@
+import queue
 from datetime import datetime
+from unittest.mock import MagicMock, patch
 
 import pytest
 from account.models import AccountAPIKey, AccountAPIKeyAnalytics
+from registry import analytics
+from registry.analytics import flush_api_key_analytics, queue_api_key_analytics
 from registry.tasks import save_api_key_analytics
 
 path = "/test_path/"
@@ -22,3 +26,58 @@ class TestSaveApiKeyAnalytics:
 
         assert created_at_day.day is datetime.now().day
         assert created_at_day.month is datetime.now().month
+
+    def test_save_api_key_analytics_raises_errors(self):
+        # Errors are not swallowed, so that Celery reports the failed task
+        with patch(
+            "registry.tasks.AccountAPIKeyAnalytics.objects.create",
+            side_effect=Exception("DB error"),
+        ):
+            with pytest.raises(Exception, match="DB error"):
+                save_api_key_analytics(1, path)
+
+    def test_queue_api_key_analytics(self, scorer_account):
+        (model, secret) = AccountAPIKey.objects.create_key(
+            account=scorer_account, name="Another token for user 1"
+        )
+
+        # The entries are flushed explicitly in this test, not by the background thread
+        with patch("registry.analytics._start_analytics_thread"):
+            queue_api_key_analytics(model.pk, path)
+            queue_api_key_analytics(model.pk, path)
+
+        assert AccountAPIKeyAnalytics.objects.filter(api_key=model).count() == 0
+
+        assert flush_api_key_analytics() == 2
+        assert (
+            AccountAPIKeyAnalytics.objects.filter(path=path, api_key=model).count()
+            == 2
+        )
+
+        # Nothing is left in the queue
+        assert flush_api_key_analytics() == 0
+
+    def test_queue_api_key_analytics_drops_entries_when_full(self, scorer_account):
+        (model, secret) = AccountAPIKey.objects.create_key(
+            account=scorer_account, name="Another token for user 1"
+        )
+
+        with patch("registry.analytics._start_analytics_thread"):
+            with patch("registry.analytics._analytics_queue", queue.Queue(maxsize=1)):
+                queue_api_key_analytics(model.pk, path)
+                queue_api_key_analytics(model.pk, path)
+
+                assert flush_api_key_analytics() == 1
+
+        assert AccountAPIKeyAnalytics.objects.filter(api_key=model).count() == 1
+
+    def test_analytics_thread_is_restarted_when_not_running(self):
+        dead_thread = MagicMock()
+        dead_thread.is_alive.return_value = False
+
+        with patch("registry.analytics._analytics_thread", dead_thread):
+            with patch("registry.analytics.threading.Thread") as mock_thread:
+                analytics._start_analytics_thread()
+
+                mock_thread.return_value.start.assert_called_once()
+                assert analytics._analytics_thread is mock_thread.return_value
@@ -8,7 +8,7 @@ from django.contrib.auth import get_user_model
 from django.test import Client, TransactionTestCase
 from registry.api.v2 import SubmitPassportPayload, get_score, submit_passport
 from registry.models import Passport, Score, Stamp
-from registry.tasks import score_passport_passport
+from registry.tasks import load_passport_record, score_passport
 from web3 import Web3
 
 User = get_user_model()
@@ -49,7 +49,7 @@ mock_passport_data = {
 }
 
 
-def mock_validate(*args, **kwargs):
+async def mock_validate(*args, **kwargs):
     return []
 
 
@@ -95,7 +95,7 @@ class TestScorePassportTestCase(TransactionTestCase):
 
     def test_no_passport(self):
         with patch("registry.tasks.get_passport", return_value=None):
-            score_passport_passport(self.community.pk, self.account.address)
+            score_passport(self.community.pk, self.account.address)
 
             passport = Passport.objects.get(
                 address=self.account.address, community_id=self.community.pk
@@ -129,7 +129,7 @@ class TestScorePassportTestCase(TransactionTestCase):
 
         mock_request = MockRequest(self.user_account)
 
-        with patch("registry.api.v1.score_passport_passport.delay", return_value=None):
+        with patch("registry.api.v1.score_registry_passport.delay", return_value=None):
             submit_passport(
                 mock_request,
                 SubmitPassportPayload(
@@ -139,8 +139,8 @@ class TestScorePassportTestCase(TransactionTestCase):
             )
 
         with patch("registry.tasks.get_passport", return_value=mock_passport_data):
-            with patch("registry.tasks.async_to_sync", return_value=mock_validate):
-                score_passport_passport(self.community.pk, address)
+            with patch("registry.tasks.validate_credential", side_effect=mock_validate):
+                score_passport(self.community.pk, address)
 
         score = get_score(mock_request, address, self.community.pk)
         assert score.score == Decimal("1")
@@ -164,8 +164,8 @@ class TestScorePassportTestCase(TransactionTestCase):
         assert Stamp.objects.filter(passport=passport).count() == 1
 
         with patch("registry.tasks.get_passport", return_value=mock_passport_data):
-            with patch("registry.tasks.async_to_sync", return_value=mock_validate):
-                score_passport_passport(self.community.pk, self.account.address)
+            with patch("registry.tasks.validate_credential", side_effect=mock_validate):
+                score_passport(self.community.pk, self.account.address)
 
                 my_stamps = Stamp.objects.filter(passport=passport)
                 assert len(my_stamps) == 2
@@ -195,10 +195,10 @@ class TestScorePassportTestCase(TransactionTestCase):
         assert Stamp.objects.filter(passport=passport).count() == 1
 
         with patch("registry.tasks.get_passport", return_value=mock_passport_data):
-            with patch("registry.tasks.async_to_sync", return_value=mock_validate):
+            with patch("registry.tasks.validate_credential", side_effect=mock_validate):
                 with patch("registry.tasks.log.info") as mock_log:
-                    score_passport_passport(self.community.pk, self.account.address)
-                    score_passport_passport(self.community.pk, self.account.address)
+                    score_passport(self.community.pk, self.account.address)
+                    score_passport(self.community.pk, self.account.address)
 
                     expected_call = call(
                         "Passport no passport found for address='%s', community_id='%s' that has requires_calculation=True or None",
@@ -210,3 +210,37 @@ class TestScorePassportTestCase(TransactionTestCase):
                         Passport.objects.get(pk=passport.pk).requires_calculation
                         is False
                     )
+
+    def test_load_passport_record_requiring_calculation(self):
+        passport = Passport.objects.create(
+            address=self.account.address.lower(),
+            community=self.community,
+            requires_calculation=True,
+        )
+
+        loaded_passport = load_passport_record(self.community.pk, self.account.address)
+
+        assert loaded_passport.pk == passport.pk
+        assert loaded_passport.requires_calculation is False
+        assert loaded_passport.community == self.community
+        assert Passport.objects.get(pk=passport.pk).requires_calculation is False
+
+    def test_load_passport_record_not_requiring_calculation(self):
+        Passport.objects.create(
+            address=self.account.address.lower(),
+            community=self.community,
+            requires_calculation=False,
+        )
+
+        assert load_passport_record(self.community.pk, self.account.address) is None
+        assert Passport.objects.count() == 1
+
+    def test_load_passport_record_creates_missing_passport(self):
+        assert Passport.objects.count() == 0
+
+        loaded_passport = load_passport_record(self.community.pk, self.account.address)
+
+        passport = Passport.objects.get(
+            address=self.account.address.lower(), community=self.community
+        )
+        assert loaded_passport.pk == passport.pk
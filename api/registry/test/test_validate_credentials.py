@@ -0,0 +1,62 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from registry import tasks
+from registry.tasks import init_worker_event_loop, run_async, validate_credentials
+
+stamps = [
+    {"provider": "Ens", "credential": {"fail": False}},
+    {"provider": "Google", "credential": {"fail": True}},
+]
+
+
+@pytest.fixture
+def worker_event_loop():
+    loop = asyncio.new_event_loop()
+    with patch("registry.tasks._worker_event_loop", loop):
+        yield loop
+    loop.close()
+
+
+def test_init_worker_event_loop():
+    with patch("registry.tasks._worker_event_loop", None):
+        init_worker_event_loop()
+        loop = tasks._worker_event_loop
+        assert isinstance(loop, asyncio.AbstractEventLoop)
+        assert asyncio.get_event_loop() is loop
+
+    asyncio.set_event_loop(None)
+    loop.close()
+
+
+def test_run_async_uses_worker_event_loop(worker_event_loop):
+    with patch(
+        "registry.tasks.validate_credential", side_effect=[[], ["Did mismatch"]]
+    ):
+        with patch("registry.tasks.async_to_sync") as async_to_sync:
+            errors = run_async(validate_credentials, "did:pkh:eip155:1:0x01", stamps)
+
+    async_to_sync.assert_not_called()
+    assert errors == [[], ["Did mismatch"]]
+
+
+def test_failed_validation_cancels_pending_validations(worker_event_loop):
+    cancelled = []
+
+    async def mock_validate(did, credential):
+        if credential["fail"]:
+            raise Exception("validation failed")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(credential)
+            raise
+
+    with patch("registry.tasks.validate_credential", side_effect=mock_validate):
+        with pytest.raises(Exception, match="validation failed"):
+            run_async(validate_credentials, "did:pkh:eip155:1:0x01", stamps)
+
+    # Nothing is left on the worker loop, that would run during the next task
+    assert cancelled == [stamps[0]["credential"]]
+    assert not asyncio.all_tasks(worker_event_loop)
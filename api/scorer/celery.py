@@ -1,6 +1,8 @@
 import os
+import sys
 
 from celery import Celery
+from celery.signals import worker_init
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "scorer.settings")
@@ -17,11 +19,31 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
 
 app.conf.task_routes = {
+    "registry.tasks.score_passport": {"queue": "score_registry_passport"},
     "registry.tasks.score_registry_passport": {"queue": "score_registry_passport"},
     "registry.tasks.score_passport_passport": {"queue": "score_passport_passport"},
 }
 
 
+@worker_init.connect
+def patch_psycopg_for_gevent(**kwargs):
+    """
+    The scoring tasks are mostly waiting for network I/O, so the workers can be run with
+    the gevent pool (`-P gevent`, see SETUP.md for the concurrency). In that case psycopg2 needs
+    to be made green as well, otherwise each DB query blocks all greenlets of the worker.
+    """
+    # Celery imports gevent and monkey patches the process only when started with `-P gevent`
+    if "gevent" not in sys.modules:
+        return
+
+    from gevent import monkey
+
+    if monkey.is_module_patched("socket"):
+        from psycogreen.gevent import patch_psycopg
+
+        patch_psycopg()
+
+
 @app.task(bind=True)
 def debug_task(self):
     print(f"Request: {self.request!r}")
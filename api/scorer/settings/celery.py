@@ -1,3 +1,12 @@
 from .env import env
 
 CELERY_BROKER_URL = env("CELERY_BROKER_URL", default="redis://localhost:6379/0")
+
+# Recycle the worker processes regularly, to release the memory accumulated by long running workers
+CELERY_WORKER_MAX_TASKS_PER_CHILD = env.int(
+    "CELERY_WORKER_MAX_TASKS_PER_CHILD", default=200
+)
+# Maximum resident memory (in KB) of a worker process before it is replaced
+CELERY_WORKER_MAX_MEMORY_PER_CHILD = env.int(
+    "CELERY_WORKER_MAX_MEMORY_PER_CHILD", default=400000
+)